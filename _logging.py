@@ -0,0 +1,34 @@
+import logging
+import os
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATEFMT = '%Y-%m-%d, %H:%M:%S'
+
+
+def configure(name: str, filename: str, level=logging.ERROR) -> logging.Logger:
+
+    """
+    Creates the logger of a module which writes into its own log file.
+    The file is opened with the first log record, so importing a module doesn't create any file.
+    Calling it again for the same logger and file doesn't add a second handler.
+
+    :param name: The name of the logger, usually __name__ of the module.
+    :param filename: The path of the log file.
+    :type filename: str
+    :param level: The lowest level which will be logged.
+    :type level: int, default logging.ERROR
+    :return: The configured logger.
+    :rtype: logging.Logger
+    """
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+
+    path = os.path.abspath(filename)
+    if not any(isinstance(handler, logging.FileHandler) and handler.baseFilename == path
+               for handler in logger.handlers):
+        handler = logging.FileHandler(path, encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATEFMT))
+        logger.addHandler(handler)
+
+    return logger
@@ -0,0 +1,35 @@
+from contextlib import closing, nullcontext
+
+import pytest
+
+try:
+    from filelock import FileLock
+except ImportError:
+    FileLock = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def mysql_schema(request, tmp_path_factory):
+    """
+    Erstellt Testtabelle und Prozeduren einmal pro pytest-Lauf, bevor
+    ein Live-Test startet. Unter pytest-xdist hat jeder Worker eigene
+    Tabellen und Prozeduren, die Sperrdatei sorgt dafür, dass die DDL
+    der Worker nacheinander und nicht gleichzeitig auf die Metadaten
+    des Servers zugreift. Ohne filelock wird ohne Sperre erstellt.
+    """
+    # Läufe ohne die Live-Tests brauchen keine Datenbank
+    if not any(item.path.name == "test_mysql_data_manager.py" for item in request.session.items):
+        return
+
+    import mysql.connector
+    from settings import mariadb_config
+    from test_mysql_data_manager import create_schema
+
+    # Das Basisverzeichnis ist für alle xdist-Worker eines Laufs dasselbe
+    lock_path = tmp_path_factory.getbasetemp().parent / "datalayer_schema.lock"
+    lock = FileLock(str(lock_path)) if FileLock is not None else nullcontext()
+
+    with lock, closing(mysql.connector.connect(**mariadb_config)) as conn:
+        conn.autocommit = True
+        with closing(conn.cursor()) as cursor:
+            create_schema(cursor)
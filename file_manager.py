@@ -1,6 +1,36 @@
+from functools import lru_cache
 from pathlib import Path
 import csv
 import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@lru_cache(maxsize=32)
+def _scan_dir(path: str, mtime_ns: int, suffixes: frozenset) -> tuple[Path, ...]:
+
+    """
+    Lists the files with the given suffixes in a directory.
+    The modification time of the directory is part of the cache key,
+    so the directory is only scanned again if files were added, removed or renamed.
+    Some file systems store the modification time only in steps of a second or more (FAT even two seconds),
+    a change within the same step after the last scan isn't seen then. FileManager.get_files(refresh=True)
+    scans again in that case.
+
+    :param path: The path of the directory.
+    :param mtime_ns: The modification time of the directory in nanoseconds.
+    :param suffixes: The allowed suffixes.
+    :return: The paths of the matching files.
+    :rtype: tuple[Path, ...]
+    """
+
+    with os.scandir(path) as entries:
+        return tuple(Path(entry.path) for entry in entries
+                     if entry.is_file() and os.path.splitext(entry.name)[1] in suffixes)
 
 
 class FileManager:
@@ -21,7 +51,7 @@ class FileManager:
         """
 
         self.default_dir = Path.cwd().joinpath(default_subdir)
-        self.suffixes = allowed_suffixes
+        self.suffixes = frozenset(allowed_suffixes)
 
     def set_default_dir(self, new_path: str | Path):
 
@@ -45,16 +75,23 @@ class FileManager:
 
         self.default_dir = Path.joinpath(self.default_dir, additional_path)
 
-    def get_files(self) -> list[Path]:
+    def get_files(self, refresh=False) -> list[Path]:
 
         """
         To get all csv or text files in a given subdirectory.
+        The result is cached as long as the directory isn't changed.
 
+        :param refresh: Scans the directory again also if its modification time hasn't changed.
+        :type refresh: bool, default False.
         :return: A list of file paths in a given directory.
         :rtype: list[Path].
         """
 
-        files = [file for file in Path.joinpath(self.default_dir).iterdir() if file.suffix in self.suffixes]
+        if refresh:
+            _scan_dir.cache_clear()
+
+        path = os.fspath(self.default_dir)
+        files = list(_scan_dir(path, os.stat(path).st_mtime_ns, self.suffixes))
 
         return files
 
@@ -63,36 +100,38 @@ class FileManager:
         """
         To get a specific csv file in a given directory.
 
-        :return: A Path object or None if program is keyboard interrupted.
-        :rtype: Path
+        :return: A Path object or None if the user quits with 'q' or 'Q'.
+        :rtype: Path | None
         """
 
-        files = [file for file in Path.cwd().joinpath(self.default_dir).iterdir() if file.suffix in self.suffixes]
+        files = self.get_files()
 
         for index, name in enumerate(files):
             print(f"{index} type for:", name.name)
 
-        active = True
+        quit_inputs = {"q", "Q"}
+        amount = len(files)
+        quit_requested = False
         custom_index = 0
 
         print("You can quit the program with 'q' or 'Q'.")
 
-        while active:
-            try:
-                custom_index = input("Input: ")
-                if custom_index in ("q", "Q"):
-                    break
+        while True:
+            user_input = input("Input: ")
+            if user_input in quit_inputs:
+                quit_requested = True
+                break
 
-                custom_index = int(custom_index)
+            try:
+                custom_index = int(user_input)
             except ValueError:
                 print("Wrong Input")
             else:
-                if custom_index < 0 or custom_index >= len(files):
-                    print("There is no data under the index:", custom_index)
-                else:
-                    active = False
+                if 0 <= custom_index < amount:
+                    break
+                print("There is no data under the index:", custom_index)
 
-        if custom_index in ("q", "Q"):
+        if quit_requested:
             return None
 
         output_file = files[custom_index]
@@ -116,12 +155,10 @@ class CsvFileManager(FileManager):
         """
 
         with open(Path().joinpath(self.default_dir.parent, file_path), 'w', newline='',
-                  encoding="ISO-8859-1") as csvfile:
+                  encoding="ISO-8859-1", buffering=1 << 20) as csvfile:
 
             csv_writer = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-
-            for line in csv_list:
-                csv_writer.writerow(line)
+            csv_writer.writerows(csv_list)
 
         return True
 
@@ -135,15 +172,23 @@ class JsonFileManager(FileManager):
 
         """
         This method writes a python dictionary or jsonified string of records to the specified path on disk.
-        It doesn't check the structure of the data.
+        It doesn't check the structure of the data. A jsonified string is written as it is.
+        Python objects are serialized with orjson if it's installed, otherwise with the json module.
 
         :param file_path: The path to the file.
         :param json_data: The data which will be written. It can handel json_string and also python dictionaries
         :return: True if it's done for awaiting purposes.
         """
 
-        with open(Path().joinpath(self.default_dir.parent, file_path), "w") as jsonfile:
+        if isinstance(json_data, str):
+            data = json_data.encode()
+        elif orjson is not None:
+            data = orjson.dumps(json_data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        else:
+            data = json.dumps(json_data).encode()
 
-            json.dump(json_data, jsonfile)
+        with open(Path().joinpath(self.default_dir.parent, file_path), "wb") as jsonfile:
 
-        return True
\ No newline at end of file
+            jsonfile.write(data)
+
+        return True
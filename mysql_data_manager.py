@@ -1,110 +1,654 @@
+from __future__ import annotations
+
 import mysql.connector
-import logging
-from time import sleep
+from mysql.connector import errorcode
+from mysql.connector.errors import PoolError
+from mysql.connector.abstracts import MySQLConnectionAbstract
+from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection
+import csv
+import hashlib
+import os
+import random
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from time import monotonic, sleep
+
+try:
+    from ._logging import configure
+except ImportError:
+    from _logging import configure
 
 # Logging if something goes wrong
-logger = logging.getLogger(__name__)
-logging.basicConfig(filename="mysql_data_manager.log", encoding="utf-8", level=logging.ERROR,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d, %H:%M:%S')
+logger = configure(__name__, "mysql_data_manager.log")
+
+# Splits a plain "INSERT INTO ... VALUES (%s, ...)" statement into its head and the row template
+INSERT_VALUES = re.compile(r"^\s*(INSERT\s+(?:IGNORE\s+)?INTO\s+.+?\s+VALUES)\s*(\([^()]*\))\s*;?\s*$",
+                           re.IGNORECASE | re.DOTALL)
+
+# Finds the table and the optional column list of an "INSERT INTO table (columns) VALUES" statement
+INSERT_TARGET = re.compile(r"^\s*INSERT\s+INTO\s+([\w.`]+)\s*(?:\(([^()]*)\))?\s*VALUES", re.IGNORECASE)
+
+# Quoted strings, identifiers and optimizer hints are kept as they are,
+# runs of whitespace and comments are reduced to one space
+SQL_TOKEN = re.compile(r"""('(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`|/\*[!+].*?\*/)"""
+                       r"|((?:\s|/\*(?![!+]).*?\*/|--(?=\s|$)[^\n]*|#[^\n]*)+)", re.DOTALL)
+
+# Client errors of a refused, lost or overloaded connection, which can be gone with the next attempt.
+# The C extension raises them as DatabaseError, so they are checked by their number.
+TRANSIENT_ERRNOS = frozenset((errorcode.CR_CONNECTION_ERROR, errorcode.CR_CONN_HOST_ERROR,
+                              errorcode.CR_SERVER_GONE_ERROR, errorcode.CR_SERVER_LOST,
+                              errorcode.CR_SERVER_LOST_EXTENDED, errorcode.ER_CON_COUNT_ERROR))
+
+# Maximum amount of prepared statements kept per pooled connection
+STMT_CACHE_SIZE = 128
+
+# A prepared statement can't have more placeholders
+MAX_PLACEHOLDERS = 65535
+
+# Character set names can't be given as parameter, so they are checked before they are put into the statement
+CHARSET_NAME = re.compile(r"^\w+$")
+
+
+def _is_transient(err: Exception) -> bool:
+
+    """
+    Decides if a failed connection attempt is worth another try.
+    Errors like a denied access or an unknown database are raised at once.
+
+    :param err: The error of the connection attempt.
+    :return: True if the error can be gone with the next attempt.
+    :rtype: bool
+    """
+
+    if isinstance(err, (mysql.connector.InterfaceError, mysql.connector.OperationalError, IOError)):
+        return getattr(err, "errno", None) not in (errorcode.ER_ACCESS_DENIED_ERROR, errorcode.ER_BAD_DB_ERROR)
+    return getattr(err, "errno", None) in TRANSIENT_ERRNOS
+
+
+@lru_cache(maxsize=1024)
+def _normalize(sqlstring: str) -> str:
+
+    """
+    Brings equal statements with other spacing, comments or a trailing semicolon into one form,
+    so they share one prepared statement. Keywords keep their case, because in mysql
+    the case of table names can matter and quoted strings must not be changed.
+
+    :param sqlstring: The sql statement given as string.
+    :return: The statement without comments, with single spaces and without a trailing semicolon.
+    :rtype: str
+    """
+
+    sqlstring = SQL_TOKEN.sub(lambda match: match.group(1) if match.group(1) is not None else " ", sqlstring)
+    return sqlstring.strip().rstrip(";").rstrip()
+
+
+@lru_cache(maxsize=256)
+def _expand_insert(sqlstring: str, rows: int) -> str:
+
+    """
+    Builds the multi-row insert for the given amount of records, it's used for the full chunks.
+    The same string object is returned for the same statement and amount,
+    so the prepared statement of a chunk is found again and executed without a new prepare.
+
+    :param sqlstring: A plain "INSERT INTO ... VALUES (%s, ...)" statement.
+    :param rows: The amount of records in the chunk.
+    :return: The insert with one row template per record.
+    :rtype: str
+    """
+
+    match = INSERT_VALUES.match(sqlstring)
+    return match.group(1) + " " + ",".join([match.group(2)] * rows)
 
 
 class MysqlDataManager:
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict | MySQLConnectionPool, cache_size=0, breaker_threshold=5, breaker_reset=30.0):
 
-        self.config = config
+        """
+        Needs the connection config for the mariadb database or an already created connection pool.
+        The optional key "pool_size" in the config sets the amount of pooled connections, 0 disables the pool.
+        The optional key "pool_reset_session" resets the session when a connection goes back to the pool,
+        that also drops the prepared statements of the connection. It is False by default.
+        The connections use the C extension (CMySQLConnection) if it's available and "use_pure" isn't set.
 
-    def init_conn(self, attempts=3, delay=2):
+        :param config: The connection arguments for mysql.connector or a connection pool.
+        :type config: dict | mysql.connector.pooling.MySQLConnectionPool
+        :param cache_size: Amount of select results kept in memory, 0 disables the cache.
+            The cache is only flushed by the writing actions of this instance, so it should only be used
+            if no other process or connection writes to the same tables.
+        :type cache_size: int, default 0
+        :param breaker_threshold: Amount of failed connection attempts in a row after that init_conn fails fast.
+        :type breaker_threshold: int, default 5
+        :param breaker_reset: Seconds init_conn fails fast before a new connection attempt is allowed.
+        :type breaker_reset: float, default 30.0
+        """
+
+        if isinstance(config, MySQLConnectionPool):
+            self.config = {}
+            self.pool_size = config.pool_size
+            self.pool_reset_session = config.reset_session
+            self._pool = config
+        else:
+            self.config = dict(config)
+            # The C extension decodes the rows much faster than the pure python protocol
+            self.config.setdefault("use_pure", not mysql.connector.HAVE_CEXT)
+            self.pool_size = self.config.pop("pool_size", 8)
+            self.pool_reset_session = self.config.pop("pool_reset_session", False)
+            self._pool = None
+
+        self._pool_lock = threading.Lock()
+        self.cache_size = cache_size
+        self._stmt_cache = weakref.WeakKeyDictionary()
+        self._stmt_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._breaker = {"fails": 0, "opened_at": None, "probing": None,
+                         "threshold": breaker_threshold, "reset": breaker_reset}
+        self._breaker_lock = threading.Lock()
+
+    def init_conn(self, attempts=3, base_delay=1.0, max_delay=30.0, jitter=0.5) \
+            -> PooledMySQLConnection | MySQLConnectionAbstract:
 
         """
-        Initialize the connection with my mariadb database.
+        Get a connection from the pool for my mariadb database.
+        The pool is created with the first call. Creating the pool and getting a connection from it,
+        which reconnects a lost pooled connection, are repeated on failures.
+        Closing the returned connection gives it back to the pool.
+        Without a pool (pool_size 0) every call opens a new connection, also with the reconnection routine.
+        Only transient errors like a refused or lost connection are repeated, others are raised at once.
+        After breaker_threshold failed attempts in a row it raises at once for breaker_reset seconds
+        without trying to connect, also if the database is gone after the pool was created.
+        Then a single call tries again, all others keep raising until this attempt succeeded or failed.
+        An exhausted pool doesn't count as failed attempt.
 
         :param attempts: amount of attempts.
         :type attempts: int, default 3.
-        :param delay: waiting seconds for trying to reconnect.
-        :type delay: int, default 2.
+        :param base_delay: waiting seconds before the second attempt, doubled with every further attempt.
+        :type base_delay: float, default 1.0.
+        :param max_delay: upper limit of waiting seconds between two attempts.
+        :type max_delay: float, default 30.0.
+        :param jitter: the delay is stretched by a random share up to this factor against simultaneous reconnects.
+        :type jitter: float, default 0.5.
         :raise mysql.connector.Error | IOError: If it occurs, will be logged
-        :return: A MySQLConnectionAbstract subclass instance (such as MySQLConnection or CMySQLConnection) or a PooledMySQLConnection instance.
-        :rtype: mysql.connector.MySQLConnection | mysql.connector.MySQLConnectionAbstract | mysql.connector.PooledMySQLConnection
+        :raise ValueError: If attempts is lower than 1.
+        :return: A PooledMySQLConnection instance or a MySQLConnectionAbstract subclass instance without a pool.
+        :rtype: mysql.connector.pooling.PooledMySQLConnection | mysql.connector.abstracts.MySQLConnectionAbstract
         """
 
-        attempt = 1
+        if attempts < 1:
+            raise ValueError(f"At least one attempt is needed to connect, got {attempts}")
+
         # Implement a reconnection routine
-        while attempt < attempts + 1:
+        for attempt in range(attempts):
+            probe = self._check_breaker()
             try:
-                return mysql.connector.connect(**self.config)
+                if not self.pool_size:
+                    mydb = mysql.connector.connect(**self.config)
+                else:
+                    mydb = self._create_pool().get_connection()
             except (mysql.connector.Error, IOError) as err:
-                if attempts is attempt:
+                if not isinstance(err, PoolError):
+                    self._record_failure(probe)
+                elif probe:
+                    # An exhausted pool says nothing about the database, so the next call may try again
+                    with self._breaker_lock:
+                        self._breaker["probing"] = None
+                if attempt + 1 >= attempts or not _is_transient(err):
                     # Attempts to reconnect failed;
                     logger.error("Failed to connect, exiting without a connection: %s", err)
                     raise err
                 logger.info(
                     "Connection failed: %s. Retrying (%d/%d)...",
                     err,
-                    attempt,
+                    attempt + 1,
                     attempts - 1,
                 )
-                # progressive reconnect delay
-                sleep(delay ** attempt)
-                attempt += 1
+                # exponential reconnect delay with jitter against simultaneous reconnects
+                sleep(min(max_delay, base_delay * 2 ** attempt * (1 + random.random() * jitter)))
+            else:
+                if self._breaker["fails"]:
+                    with self._breaker_lock:
+                        self._breaker["fails"] = 0
+                        self._breaker["opened_at"] = None
+                        self._breaker["probing"] = None
+                return mydb
+
+    def _create_pool(self) -> MySQLConnectionPool:
+
+        """
+        Creates the pool once, also if many threads ask for their first connection at the same time.
+
+        :raise mysql.connector.Error | IOError: If the connections of the pool can't be opened.
+        :return: The connection pool.
+        :rtype: mysql.connector.pooling.MySQLConnectionPool
+        """
+
+        if self._pool is not None:
+            return self._pool
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = MySQLConnectionPool(
+                    pool_size=self.pool_size, pool_reset_session=self.pool_reset_session, **self.config)
+            return self._pool
+
+    def _check_breaker(self) -> bool:
+
+        """
+        Raises at once while the circuit is open, so a database which is down isn't asked again and again.
+        When breaker_reset seconds are over, only the next attempt is let through as probe.
+        If the probe doesn't report back within breaker_reset seconds, another one is let through.
+
+        :raise mysql.connector.Error: If the circuit is open, will be logged
+        :return: True if the attempt is the probe of an open circuit.
+        :rtype: bool
+        """
+
+        if self._breaker["opened_at"] is None:
+            return False
+
+        with self._breaker_lock:
+            opened_at = self._breaker["opened_at"]
+            if opened_at is None:
+                return False
+
+            now = monotonic()
+            probing = self._breaker["probing"]
+            if now - opened_at >= self._breaker["reset"] and (
+                    probing is None or now - probing >= self._breaker["reset"]):
+                self._breaker["probing"] = now
+                return True
+
+        logger.error("Circuit open after %d failed connection attempts, not connecting", self._breaker["fails"])
+        raise mysql.connector.Error(msg="Circuit open, the database was not reachable in the last attempts")
+
+    def _record_failure(self, probe=False):
+
+        """
+        Counts a failed connection attempt and opens the circuit if there were breaker_threshold ones in a row.
+        A failed attempt after the circuit was open opens it again at once.
 
-    def select(self, sqlstring: str) -> list:
+        :param probe: True if the attempt was the probe of an open circuit.
+        :type probe: bool, default False.
+        """
+
+        with self._breaker_lock:
+            if probe:
+                self._breaker["probing"] = None
+            self._breaker["fails"] += 1
+            if self._breaker["fails"] >= self._breaker["threshold"]:
+                self._breaker["opened_at"] = monotonic()
+
+    def select(self, sqlstring: str, val=None) -> list:
 
         """
         Used only for reading actions to the database.
+        With positional parameters the statement is prepared once per pooled connection and executed again
+        on later calls. The rows of a prepared statement are decoded by the binary protocol, see _execute for the differences.
 
         :param sqlstring: The select statement as string given.
         :type sqlstring: str
+        :param val: Can be None or a tuple or dict with the parameters of the statement.
+        :type val: tuple | dict | None, default None
         :raise mysql.connector.Error | IOError: If it occurs, will be logged
         :return: Return always a list with at least one tuple, can also be empty.
         :rtype: list[tuple]
         """
 
-        mydb = self.init_conn()
-        cursor = mydb.cursor()
+        if self.cache_size <= 0:
+            return list(self.iter_select(sqlstring, val))
 
-        try:
-            cursor.execute(sqlstring)
-            result = cursor.fetchall()
+        key = hashlib.blake2b(repr((sqlstring, val)).encode(), digest_size=16).digest()
+        result = self._cache_get(key)
+        if result is not None:
             return result
-        except (mysql.connector.Error, IOError) as err:
-            logger.error("Something goes wrong while selecting data: %s", err)
-            raise err
-        finally:
-            mydb.close()
 
-    def query(self, sqlstring, val=None) -> int:
+        result = list(self.iter_select(sqlstring, val))
+        self._cache_put(key, result)
+        return list(result)
+
+    def iter_select(self, sqlstring: str, val=None, arraysize=1000):
+
+        """
+        Used only for reading actions to the database.
+        Yields the rows while they are fetched in batches, so the whole result is never held in memory.
+        The connection goes back to the pool when the iteration ends.
+
+        :param sqlstring: The select statement as string given.
+        :type sqlstring: str
+        :param val: Can be None or a tuple or dict with the parameters of the statement,
+            with parameters the statement is prepared like in select.
+        :type val: tuple | dict | None, default None
+        :param arraysize: Amount of rows fetched at once.
+        :type arraysize: int, default 1000
+        :raise mysql.connector.Error | IOError: If it occurs, will be logged
+        :return: A generator of the rows.
+        :rtype: Generator[tuple]
+        """
+
+        with closing(self.init_conn()) as mydb:
+            try:
+                with self._executed(mydb, sqlstring, val) as cursor:
+                    try:
+                        while True:
+                            rows = cursor.fetchmany(arraysize)
+                            if not rows:
+                                break
+                            yield from rows
+                    finally:
+                        # Rows left by a stopped iteration must be read before the connection can be used again
+                        if mydb.unread_result:
+                            cursor.fetchall()
+            except (mysql.connector.Error, IOError) as err:
+                logger.error("Something goes wrong while selecting data: %s", err)
+                raise err
+            finally:
+                # Ends the read snapshot, the next user of the pooled connection must see current data
+                self._rollback(mydb)
+
+    def query(self, sqlstring, val=None, chunk_size=1000) -> int:
 
         """
         Can be used for create, delete, update method to the database.
+        Plain inserts with a list of records are sent as one multi-row insert per chunk.
 
         :param sqlstring: The query sql statement given as string
-        :param val: Can be None or a list or tuple
+        :param val: Can be None or a list of records or a tuple or dict with the parameters
+        :param chunk_size: Maximum amount of records for one multi-row insert.
+        :type chunk_size: int, default 1000
         :raise mysql.connector.Error | IOError: If it occurs, will be logged
         :return: integer about how many rows were affected, can be also 0.
         :rtype: int
         """
 
-        mydb = self.init_conn()
-        mycursor = mydb.cursor()
+        self.invalidate_cache()
+
+        with closing(self.init_conn()) as mydb:
+            try:
+                if isinstance(val, list):
+                    rowcount = self._executemany(mydb, sqlstring, val, chunk_size)
+                else:
+                    with self._executed(mydb, sqlstring, val if isinstance(val, (tuple, dict)) else None) as cursor:
+                        rowcount = cursor.rowcount
+                mydb.commit()
+                return rowcount
+
+            except (mysql.connector.Error, IOError) as err:
+                logger.error("Something goes wrong while querying the data: %s", err)
+                self._rollback(mydb)
+                raise err
+
+    def _execute(self, mydb, sqlstring: str, val=None):
 
+        """
+        Executes a statement with positional parameters with a prepared cursor which is cached per connection
+        and sql statement, so a repeated statement is only prepared once per pooled connection.
+        Statements with named parameters (a dict) are executed with a plain cursor.
+        Every connection keeps at most STMT_CACHE_SIZE statements, the least recently used one is closed.
+        Statements without parameters and statements which can't be prepared are executed with a plain cursor.
+        Prepared statements use the binary protocol, their rows come back with other types for some columns
+        (BIT as bytes instead of int, SET as str instead of set) and the connection options "raw" and
+        "converter_class" are not applied.
+
+        :param mydb: A connection from the pool, without a pool a plain cursor is always used.
+        :param sqlstring: The sql statement given as string.
+        :param val: Can be None or a tuple, list or dict with the parameters.
+        :return: The cursor after the execution and True if it belongs to the statement cache,
+            otherwise the caller has to close it.
+        :rtype: tuple[MySQLCursorAbstract, bool]
+        """
+
+        # The prepared cursor rewrites named parameters into a new string with every call and would prepare again
+        if self._pool is None or self.pool_reset_session or not val or not isinstance(val, (tuple, list)):
+            return self._execute_plain(mydb, sqlstring, val), False
+
+        statements = self._statements(mydb)
+
+        # A trailing semicolon is not allowed in a prepared statement
+        key = _normalize(sqlstring)
+        cached = statements.get(key)
+        if cached is None:
+            cached = self._prepare(mydb, statements, key)
+        else:
+            statements.move_to_end(key)
+
+        statement, cursor = cached
         try:
-            if isinstance(val, list):
-                mycursor.executemany(sqlstring, val)
-            elif isinstance(val, tuple):
-                mycursor.execute(sqlstring, val)
-            elif not val:
-                mycursor.execute(sqlstring)
+            try:
+                cursor.execute(statement, val)
+            except mysql.connector.Error as err:
+                if err.errno != errorcode.ER_UNKNOWN_STMT_HANDLER:
+                    raise err
+                # The server doesn't know the statement anymore (e.g. after a restart with the same thread id),
+                # so it's prepared once again
+                del statements[key]
+                statement, cursor = self._prepare(mydb, statements, key)
+                cursor.execute(statement, val)
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_UNSUPPORTED_PS:
+                raise err
+            del statements[key]
+            self._close_cursor(cursor)
+            return self._execute_plain(mydb, sqlstring, val), False
 
-            mydb.commit()
-            return mycursor.rowcount
+        return cursor, True
 
-        except (mysql.connector.Error, IOError) as err:
-            logger.error("Something goes wrong while querying the data: %s", err)
-            raise err
+    def _execute_plain(self, mydb, sqlstring: str, val=None):
+
+        """
+        Executes the statement with a new plain cursor, which is closed again if the execution fails.
 
+        :param mydb: The connection which executes the statement.
+        :param sqlstring: The sql statement given as string.
+        :param val: Can be None or a tuple or dict with the parameters.
+        :return: The cursor after the execution, the caller has to close it.
+        """
+
+        cursor = mydb.cursor()
+        try:
+            cursor.execute(sqlstring, val)
+        except BaseException:
+            self._close_cursor(cursor)
+            raise
+        return cursor
+
+    @contextmanager
+    def _executed(self, mydb, sqlstring: str, val=None):
+
+        """
+        Executes the statement like _execute and closes the cursor afterwards if it isn't a cached one.
+
+        :param mydb: The connection which executes the statement.
+        :param sqlstring: The sql statement given as string.
+        :param val: Can be None or a tuple or dict with the parameters.
+        :return: A context manager with the cursor after the execution.
+        """
+
+        cursor, cached = self._execute(mydb, sqlstring, val)
+        try:
+            yield cursor
         finally:
-            mydb.close()
+            if not cached:
+                self._close_cursor(cursor)
+
+    def _statements(self, mydb) -> OrderedDict:
+
+        """
+        Returns the cached prepared statements of the connection behind the pooled connection.
+        The cache is bound to the connection object and is gone with it. If the connection was reconnected
+        since the statements were prepared, they belong to the old session and are dropped without closing.
+
+        :param mydb: A connection from the pool.
+        :return: The prepared statements of the connection by their normalized sql statement.
+        :rtype: OrderedDict
+        """
+
+        cnx = getattr(mydb, "_cnx", mydb)
+        connection_id = mydb.connection_id
+
+        # Only the thread which holds the connection uses its statements, so only the lookup is locked
+        with self._stmt_lock:
+            cached = self._stmt_cache.get(cnx)
+            if cached is None or cached[0] != connection_id:
+                cached = self._stmt_cache[cnx] = (connection_id, OrderedDict())
+
+        return cached[1]
+
+    def _prepare(self, mydb, statements: OrderedDict, key: str) -> tuple:
+
+        """
+        Creates the prepared cursor for a statement and closes the least recently used one if the cache is full.
+
+        :param mydb: A connection from the pool.
+        :param statements: The prepared statements of the connection.
+        :param key: The normalized sql statement.
+        :return: The statement and its prepared cursor.
+        :rtype: tuple[str, MySQLCursorPrepared]
+        """
+
+        # The prepared cursor prepares again if it gets another string object than the cached one
+        cached = statements[key] = (key, mydb.cursor(prepared=True))
+        if len(statements) > STMT_CACHE_SIZE:
+            self._close_cursor(statements.popitem(last=False)[1][1])
+        return cached
+
+    def clear_statement_cache(self):
+
+        """
+        Closes all cached prepared statements, e.g. after tables were dropped or altered.
+        It should only be called while no other thread uses the data manager.
+        """
+
+        with self._stmt_lock:
+            cached = list(self._stmt_cache.values())
+            self._stmt_cache = weakref.WeakKeyDictionary()
+
+        for _, statements in cached:
+            for _, cursor in statements.values():
+                self._close_cursor(cursor)
+
+    @staticmethod
+    def _close_cursor(cursor):
+
+        """
+        Closes a cursor, errors of an already lost connection are only logged.
+
+        :param cursor: The cursor.
+        """
+
+        try:
+            cursor.close()
+        except (mysql.connector.Error, IOError) as err:
+            logger.error("Something goes wrong while closing a prepared statement: %s", err)
+
+    @staticmethod
+    def _rollback(mydb):
+
+        """
+        Rolls back an open transaction, so the connection goes back to the pool without
+        uncommitted changes or an old read snapshot.
+
+        :param mydb: The connection which will be closed afterwards.
+        """
+
+        try:
+            if mydb.in_transaction:
+                mydb.rollback()
+        except (mysql.connector.Error, IOError) as err:
+            logger.error("Something goes wrong while rolling back a transaction: %s", err)
+
+    def invalidate_cache(self):
+
+        """
+        Flushes all cached select results. It is called with every writing action.
+        """
+
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _cache_get(self, key: bytes) -> list | None:
+
+        """
+        Looks up a cached select result and marks it as recently used.
+
+        :param key: The hashed sql statement.
+        :return: A copy of the cached rows or None if there is no cached result.
+        :rtype: list[tuple] | None
+        """
+
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is None:
+                return None
+            self._cache.move_to_end(key)
+            return list(result)
+
+    def _cache_put(self, key: bytes, result: list):
+
+        """
+        Stores a select result and drops the least recently used one if the cache is full.
+
+        :param key: The hashed sql statement.
+        :param result: The fetched rows.
+        """
+
+        if self.cache_size <= 0:
+            return
+
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _executemany(self, mydb, sqlstring: str, records: list, chunk_size: int) -> int:
+
+        """
+        Executes the statement for all records.
+        If the statement is a plain insert with positional parameters, every chunk of records
+        is sent as one multi-row insert, otherwise it falls back to executemany.
+        Only full chunks go through the prepared statement cache, a smaller rest or a batch smaller than
+        one chunk is sent as plain statement.
+
+        :param mydb: The connection which executes the statements.
+        :param sqlstring: The query sql statement given as string.
+        :param records: The records as list of tuples.
+        :param chunk_size: Maximum amount of records for one multi-row insert.
+        :return: The summed rowcount of all statements.
+        :rtype: int
+        """
+
+        match = INSERT_VALUES.match(sqlstring)
+        width = match.group(2).count("%s") if match else 0
+
+        if not width or not all(isinstance(record, (tuple, list)) and len(record) == width for record in records):
+            with closing(mydb.cursor()) as mycursor:
+                mycursor.executemany(sqlstring, records)
+                return mycursor.rowcount
+
+        chunk_size = max(1, min(chunk_size, MAX_PLACEHOLDERS // width))
+        rowcount = 0
+
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            values = [value for record in chunk for value in record]
+
+            if len(chunk) == chunk_size:
+                with self._executed(mydb, _expand_insert(sqlstring, chunk_size), values) as cursor:
+                    rowcount += cursor.rowcount
+            else:
+                # The rest is sent only once, preparing it would cost an extra round trip and a cache slot
+                statement = match.group(1) + " " + ",".join([match.group(2)] * len(chunk))
+                with closing(self._execute_plain(mydb, statement, values)) as cursor:
+                    rowcount += cursor.rowcount
+
+        return rowcount
 
     def call_proc(self, procname: str, args=()):
 
@@ -118,21 +662,114 @@ class MysqlDataManager:
         :rtype: list | int
         """
 
-        mydb = self.init_conn()
-        mycursor = mydb.cursor()
+        self.invalidate_cache()
         results = []
 
-        try:
-            mycursor.callproc(procname, args)
-            for result in mycursor.stored_results():
-                results.extend(result)
-            mydb.commit()
-            if len(results) > 0: return results
-            else: return mycursor.rowcount
+        with closing(self.init_conn()) as mydb, closing(mydb.cursor()) as mycursor:
+            try:
+                mycursor.callproc(procname, args)
+                for result in mycursor.stored_results():
+                    results.extend(result.fetchall())
+                mydb.commit()
+                if len(results) > 0: return results
+                else: return mycursor.rowcount
 
-        except (mysql.connector.Error, IOError) as err:
-            logger.error("Something goes wrong while calling a procedure: %s", err)
-            raise err
+            except (mysql.connector.Error, IOError) as err:
+                logger.error("Something goes wrong while calling a procedure: %s", err)
+                self._rollback(mydb)
+                raise err
 
-        finally:
-            mydb.close()
+    def bulk_ingest(self, files: list, sqlstring: str, skip_header=False, load_threshold=None) -> int:
+
+        """
+        Writes the records of many csv files parallel to the database, one thread per file.
+        Every thread takes its own connection from the pool, so the threads are limited to the pool size.
+        Without a pool every thread opens its own connection, then the threads are limited to the amount of CPUs.
+        The csv files must have the format of CsvFileManager.write_new_csv.
+
+        :param files: The paths of the csv files.
+        :type files: list[str | Path]
+        :param sqlstring: The insert statement with one placeholder per column.
+        :param skip_header: Skips the first line of every file if True.
+        :type skip_header: bool, default False
+        :param load_threshold: Files with at least this size in bytes are streamed with load_csv
+            instead of inserts. It needs "allow_local_infile" in the config. None disables it.
+        :type load_threshold: int | None, default None
+        :raise mysql.connector.Error | IOError: If it occurs, will be logged
+        :return: integer about how many rows were affected over all files.
+        :rtype: int
+        """
+
+        if not files:
+            return 0
+
+        # Creates the pool before the threads are started
+        if self.pool_size:
+            self.init_conn().close()
+
+        target = INSERT_TARGET.match(sqlstring) if load_threshold is not None else None
+
+        def ingest(file_path: str | Path) -> int:
+            if target and os.path.getsize(file_path) >= load_threshold:
+                columns = [column.strip() for column in target.group(2).split(",")] if target.group(2) else None
+                return self.load_csv(target.group(1), file_path, columns, skip_header=skip_header)
+
+            with open(file_path, newline='', encoding="ISO-8859-1") as csvfile:
+                csv_reader = csv.reader(csvfile, delimiter=',', quotechar='|')
+                if skip_header:
+                    next(csv_reader, None)
+                records = [tuple(line) for line in csv_reader if line]
+
+            return self.query(sqlstring, records) if records else 0
+
+        max_workers = min(self.pool_size or os.cpu_count() or 4, len(files))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return sum(executor.map(ingest, files))
+
+    def load_csv(self, table: str, file_path: str | Path, columns=None, delimiter=",", enclosure="|",
+                 line_terminator="\r\n", charset="latin1", skip_header=False) -> int:
+
+        """
+        Streams a csv file with LOAD DATA LOCAL INFILE into a table, which is much faster than inserts for big files.
+        The defaults match the format of CsvFileManager.write_new_csv.
+        The config needs "allow_local_infile": True, otherwise the server refuses the statement.
+
+        :param table: The name of the table, it's put into the statement as it is.
+        :param file_path: The path to the csv file.
+        :param columns: The names of the columns in the order of the csv file, None for all columns of the table.
+        :type columns: list[str] | None
+        :param delimiter: The separator of the fields.
+        :param enclosure: The quote character around fields with special characters.
+        :param line_terminator: The end of every line.
+        :param charset: The character set of the file.
+        :param skip_header: Skips the first line of the file if True.
+        :type skip_header: bool, default False
+        :raise mysql.connector.Error | IOError: If it occurs, will be logged
+        :raise ValueError: If charset isn't a plain character set name.
+        :return: integer about how many rows were loaded.
+        :rtype: int
+        """
+
+        if not CHARSET_NAME.match(charset):
+            raise ValueError(f"Invalid character set name: {charset}")
+
+        sqlstring = (f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET {charset} "
+                     "FIELDS TERMINATED BY %s OPTIONALLY ENCLOSED BY %s ESCAPED BY '' LINES TERMINATED BY %s")
+        if skip_header:
+            sqlstring += " IGNORE 1 LINES"
+        if columns:
+            sqlstring += " (" + ", ".join(columns) + ")"
+
+        self.invalidate_cache()
+
+        with closing(self.init_conn()) as mydb, closing(mydb.cursor()) as mycursor:
+            try:
+                mycursor.execute(sqlstring, (os.fspath(file_path), delimiter, enclosure, line_terminator))
+                mydb.commit()
+                return mycursor.rowcount
+
+            except (mysql.connector.Error, IOError) as err:
+                logger.error("Something goes wrong while loading a csv file: %s", err)
+                self._rollback(mydb)
+                raise err
@@ -1,15 +1,29 @@
 import sqlite3
-import logging
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from contextlib import closing
+
+try:
+    from ._logging import configure
+except ImportError:
+    from _logging import configure
 
 # Logging if something goes wrong
-logger = logging.getLogger(__name__)
-logging.basicConfig(filename="sqlite3_data_manager.log", encoding="utf-8", level=logging.ERROR,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d, %H:%M:%S')
+logger = configure(__name__, "sqlite3_data_manager.log")
+
+# Splits a plain "INSERT INTO ... VALUES (?, ...)" statement into its head and the row template
+INSERT_VALUES = re.compile(r"^\s*(INSERT\s+(?:OR\s+\w+\s+)?INTO\s+.+?\s+VALUES)\s*(\([^()]*\))\s*;?\s*$",
+                           re.IGNORECASE | re.DOTALL)
+
+# The lowest default of SQLITE_MAX_VARIABLE_NUMBER across sqlite versions
+MAX_VARIABLES = 999
 
 
 class SqliteDataManager:
 
-    def __init__(self, database_name: str, sql_script=None):
+    def __init__(self, database_name: str, sql_script=None, cache_size=0):
 
         """
         Needs a connection string for the sqlite database.
@@ -20,10 +34,22 @@ class SqliteDataManager:
         :type database_name: str
         :param sql_script: sql-script as string for creating a schema if necessary.
         :type sql_script: str or None
+        :param cache_size: Amount of select results kept in memory, 0 disables the cache.
+            The cache is only flushed by the writing actions of this instance, so it should only be used
+            if no other process or connection writes to the same tables.
+        :type cache_size: int, default 0
         """
 
         self.connection_string = database_name
         self.sql_script = sql_script
+        self.cache_size = cache_size
+        self._conn = None
+        self._initialized = False
+        self._cache = OrderedDict()
+        self._pragma_cache = {}
+        self._cache_lock = threading.Lock()
+        # All threads share one connection, a writing action holds it from BEGIN to COMMIT
+        self._conn_lock = threading.RLock()
 
     def init_database(self, conn: sqlite3.Connection):
 
@@ -47,8 +73,9 @@ class SqliteDataManager:
     def init_conn(self) -> sqlite3.Connection:
 
         """
-        Create the connection with the database and returns it.
-        Checks also if there are enough tables in the database.
+        Create the connection with the database once and returns it on every call.
+        The connection runs in autocommit mode with WAL journal and the pragmas for faster writes.
+        Only with the first call it checks also if there are enough tables in the database.
         If not, then self.sql_script will be executed if given.
 
         :raise sqlite3.Error: If it occurs will be logged.
@@ -56,19 +83,51 @@ class SqliteDataManager:
         :rtype: sqlite3.Connection
         """
 
+        with self._conn_lock:
+            return self._conn if self._conn is not None else self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+
+        """
+        Opens the connection for init_conn, it's called while the connection lock is held.
+
+        :raise sqlite3.Error: If it occurs will be logged.
+        :return: SQLite database connection object.
+        :rtype: sqlite3.Connection
+        """
+
         try:
-            conn = sqlite3.connect(self.connection_string)
+            conn = sqlite3.connect(self.connection_string, check_same_thread=False, isolation_level=None)
+            conn.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; "
+                               "PRAGMA temp_store=MEMORY; PRAGMA cache_size=-64000;")
         except sqlite3.Error as err:
             logger.error("Something goes wrong while initializing the connection to an sqlite3 database: %s", err)
             raise err
         else:
-            list_tables = conn.execute("select name from sqlite_master where type='table';").fetchall()
+            if not self._initialized:
+                if self.sql_script:
+                    # Two tables are enough to know the schema exists, no need to read the whole catalog
+                    list_tables = conn.execute("select 1 from sqlite_master where type='table' limit 2;").fetchall()
+
+                    if len(list_tables) < 2:
+                        self.init_database(conn)
 
-            if len(list_tables) < 2 and self.sql_script:
-                self.init_database(conn)
+                self._initialized = True
 
+            self._conn = conn
             return conn
 
+    def close(self):
+
+        """
+        Close the cached connection. The next call of init_conn opens a new one.
+        """
+
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
     def select(self, sqlstring: str) -> list:
 
         """
@@ -80,58 +139,218 @@ class SqliteDataManager:
         :rtype: list[tuple]
         """
 
-        mydb = self.init_conn()
-        mycursor = mydb.cursor()
+        if self.cache_size <= 0:
+            return list(self.iter_select(sqlstring))
 
-        try:
-            mycursor.execute(sqlstring)
-        except sqlite3.Error as err:
-            logger.error("Something goes wrong while selecting data: %s", err)
-            raise err
+        key = hashlib.blake2b(sqlstring.encode(), digest_size=16).digest()
+        result = self._cache_get(key)
+        if result is not None:
+            return result
+
+        result = list(self.iter_select(sqlstring))
+        self._cache_put(key, result)
+        return list(result)
+
+    def iter_select(self, sqlstring: str, arraysize=1000):
 
-        result = mycursor.fetchall()
-        mydb.close()
-        return result
+        """
+        Used only for reading actions to the database.
+        Yields the rows while they are fetched in batches, so the whole result is never held in memory.
+
+        :param sqlstring: The select statement as string given.
+        :param arraysize: Amount of rows fetched at once.
+        :type arraysize: int, default 1000
+        :raise sqlite3.Error: If it occurs will be logged.
+        :return: A generator of the rows.
+        :rtype: Generator[tuple]
+        """
+
+        with closing(self.init_conn().cursor()) as mycursor:
+            mycursor.arraysize = arraysize
+
+            try:
+                mycursor.execute(sqlstring)
+                while True:
+                    rows = mycursor.fetchmany()
+                    if not rows:
+                        break
+                    yield from rows
+            except sqlite3.Error as err:
+                logger.error("Something goes wrong while selecting data: %s", err)
+                raise err
 
     def select_pragma_info(self, tablename: str) -> list:
 
         """
         Used for getting the structure from a specific table in the database.
+        The structure is cached until the next writing action or invalidate_cache is called with schema=True.
 
         :param tablename: table name as string.
         :return: A List with all results as tuples.
         :rtype: list[tuple]
         """
 
-        return self.select(f"select * from pragma_table_info('{tablename}');")
+        with self._cache_lock:
+            result = self._pragma_cache.get(tablename)
+
+        if result is None:
+            result = self.select(f"select * from pragma_table_info('{tablename}');")
+            with self._cache_lock:
+                self._pragma_cache[tablename] = result
 
-    def query(self, sqlstring, val=None) -> int:
+        return list(result)
+
+    def invalidate_cache(self, schema=False):
+
+        """
+        Flushes all cached select results. It is called with every writing action.
+
+        :param schema: Flushes also the cached table structures if True.
+        :type schema: bool, default False.
+        """
+
+        with self._cache_lock:
+            self._cache.clear()
+            if schema:
+                self._pragma_cache.clear()
+
+    def _cache_get(self, key: bytes) -> list | None:
+
+        """
+        Looks up a cached select result and marks it as recently used.
+
+        :param key: The hashed sql statement.
+        :return: A copy of the cached rows or None if there is no cached result.
+        :rtype: list[tuple] | None
+        """
+
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is None:
+                return None
+            self._cache.move_to_end(key)
+            return list(result)
+
+    def _cache_put(self, key: bytes, result: list):
+
+        """
+        Stores a select result and drops the least recently used one if the cache is full.
+
+        :param key: The hashed sql statement.
+        :param result: The fetched rows.
+        """
+
+        if self.cache_size <= 0:
+            return
+
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def query(self, sqlstring, val=None, chunk_size=500) -> int:
 
         """
         Is used as creating, delete and update method to the database.
+        A list of records is written in chunks inside one transaction.
+        Writing actions of different threads run one after another on the shared connection.
+        Plain inserts are sent as one multi-row insert per chunk.
 
         :param sqlstring: The query sql-statement given as string.
-        :param val: Can be a tuple (if one record to insert), list (if many data) or None (if only querying).
-        :type val: tuple | list | None.
+        :param val: Can be a tuple or dict (if one record to insert), list (if many data) or None (if only querying).
+        :type val: tuple | dict | list | None.
+        :param chunk_size: Maximum amount of records for one statement if val is a list.
+        :type chunk_size: int, default 500.
+        :raise ValueError: If chunk_size is lower than 1.
         :return: integer.
         :rtype: int.
         """
 
+        if chunk_size < 1:
+            raise ValueError(f"At least one record is needed per chunk, got chunk_size {chunk_size}")
+
         mydb = self.init_conn()
-        mycursor = mydb.cursor()
 
+        with self._conn_lock, closing(mydb.cursor()) as mycursor:
+            try:
+                if isinstance(val, list):
+                    rowcount = self._executemany(mydb, mycursor, sqlstring, val, chunk_size)
+                elif isinstance(val, (tuple, dict)):
+                    mycursor.execute(sqlstring, val)
+                    rowcount = mycursor.rowcount
+                else:
+                    mycursor.execute(sqlstring)
+                    rowcount = mycursor.rowcount
+            except sqlite3.Error as err:
+                logger.error("Something goes wrong while querying data: %s", err)
+                raise err
+
+            mydb.commit()
+            # Any statement could have changed a table structure, so the cached ones are flushed as well
+            self.invalidate_cache(schema=True)
+            return rowcount
+
+    @staticmethod
+    def _executemany(mydb: sqlite3.Connection, cursor: sqlite3.Cursor, sqlstring: str, records: list,
+                     chunk_size: int) -> int:
+
+        """
+        Writes all records inside one transaction, which is rolled back on any error,
+        so the shared connection is never left inside an open transaction.
+
+        :param mydb: The shared connection in autocommit mode.
+        :param cursor: The cursor which executes the statements.
+        :param sqlstring: The query sql-statement given as string.
+        :param records: The records as list of tuples.
+        :param chunk_size: Maximum amount of records for one statement.
+        :return: The summed rowcount of all chunks.
+        :rtype: int
+        """
+
+        mydb.execute("BEGIN IMMEDIATE")
         try:
-            if isinstance(val, list):
-                mycursor.executemany(sqlstring, val)
-            elif isinstance(val, tuple):
-                mycursor.execute(sqlstring, val)
-            elif not val:
-                mycursor.execute(sqlstring)
+            return SqliteDataManager._execute_chunks(cursor, sqlstring, records, chunk_size)
+        except BaseException:
+            mydb.rollback()
+            raise
 
-        except sqlite3.Error as err:
-            logger.error("Something goes wrong while querying data: %s", err)
-            raise err
+    @staticmethod
+    def _execute_chunks(cursor: sqlite3.Cursor, sqlstring: str, records: list, chunk_size: int) -> int:
+
+        """
+        Executes the statement for the records chunk by chunk.
+        If the statement is a plain insert with positional parameters, every chunk becomes one multi-row insert,
+        otherwise executemany is used per chunk.
+
+        :param cursor: The cursor which executes the statements.
+        :param sqlstring: The query sql-statement given as string.
+        :param records: The records as list of tuples.
+        :param chunk_size: Maximum amount of records for one statement.
+        :return: The summed rowcount of all chunks.
+        :rtype: int
+        """
+
+        match = INSERT_VALUES.match(sqlstring)
+
+        if match and records:
+            width = match.group(2).count("?")
+            if width and all(isinstance(record, (tuple, list)) and len(record) == width for record in records):
+                chunk_size = max(1, min(chunk_size, MAX_VARIABLES // width))
+            else:
+                match = None
+
+        rowcount = 0
+
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+
+            if match:
+                statement = match.group(1) + " " + ",".join([match.group(2)] * len(chunk))
+                cursor.execute(statement, [value for record in chunk for value in record])
+            else:
+                cursor.executemany(sqlstring, chunk)
+
+            rowcount += cursor.rowcount
 
-        mydb.commit()
-        mydb.close()
-        return mycursor.rowcount
+        return rowcount
@@ -1,178 +1,266 @@
+import os
+import textwrap
+import time
 import unittest
+from typing import ClassVar
+from unittest import mock
 import mysql.connector
 import logging
+from mysql.connector.pooling import MySQLConnectionPool
+from _logging import configure
 from mysql_data_manager import MysqlDataManager
 from settings import mariadb_config
 
-# Logging-Level für den Test anpassen, um die Ausgabe zu reduzieren
+# Beim Import wird nichts geschrieben, die Logdatei gibt es nur mit DATALAYER_TEST_LOG=1 (siehe setUpClass)
 logger = logging.getLogger(__name__)
-logging.basicConfig(filename="test_mysql_data_manager.log", encoding="utf-8", level=logging.ERROR,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d, %H:%M:%S')
+logger.addHandler(logging.NullHandler())
+
+# Bei Änderungen an Tabelle oder Prozeduren erhöhen, damit sie neu erstellt werden
+SCHEMA_VERSION = 1
+
+# Unter pytest-xdist bekommt jeder Worker eigene Tabellen und Prozeduren (z. B. users_gw0),
+# damit parallel laufende Tests sich nicht gegenseitig die Daten löschen
+_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "")
+_SUFFIX = f"_{_WORKER}" if _WORKER else ""
+USERS_TABLE = f"users{_SUFFIX}"
+VERSION_TABLE = f"__test_schema_version{_SUFFIX}"
+PROC_SELECT = f"get_user_by_name{_SUFFIX}"
+PROC_INSERT = f"add_user_proc{_SUFFIX}"
+
+# DDL der Testumgebung, nur einmal beim Laden des Moduls eingerückt
+DDL_USERS = textwrap.dedent(f"""\
+    CREATE TABLE IF NOT EXISTS {USERS_TABLE} (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255),
+        email VARCHAR(255)
+    );""")
+
+# Prozedur 1: SELECT
+DDL_PROC_SELECT = textwrap.dedent(f"""\
+    CREATE OR REPLACE PROCEDURE {PROC_SELECT}(IN uname VARCHAR(255))
+    BEGIN
+        SELECT id, name, email FROM {USERS_TABLE} WHERE name = uname;
+    END;""")
+
+# Prozedur 2: INSERT für den rowcount-Test
+DDL_PROC_INSERT = textwrap.dedent(f"""\
+    CREATE OR REPLACE PROCEDURE {PROC_INSERT}(IN uname VARCHAR(255), IN uemail VARCHAR(255))
+    BEGIN
+        INSERT INTO {USERS_TABLE} (name, email) VALUES (uname, uemail);
+    END;""")
+
+DDL_SCHEMA_VERSION = textwrap.dedent(f"""\
+    CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INT NOT NULL);
+    DELETE FROM {VERSION_TABLE};
+    INSERT INTO {VERSION_TABLE} (version) VALUES (%s);""")
+
+# Das ganze Schema als ein Skript, der einzige Parameter ist die Version
+DDL_SCHEMA = "\n".join((DDL_USERS, DDL_PROC_SELECT, DDL_PROC_INSERT, DDL_SCHEMA_VERSION))
+
+SQL_SCHEMA_VERSION = f"SELECT version FROM {VERSION_TABLE};"
+
+
+def run_script(cursor, script, params=()):
+    """
+    Führt mehrere Anweisungen mit einem einzigen Roundtrip aus und
+    liest alle Ergebnisse, damit die Verbindung wieder frei ist.
+    """
+    cursor.execute(script, params)
+    while cursor.nextset():
+        pass
+
+
+def schema_is_current(cursor) -> bool:
+    """
+    Prüft anhand der Tabelle __test_schema_version, ob Tabelle und
+    Prozeduren in der aktuellen Version schon existieren.
+    """
+    try:
+        cursor.execute(SQL_SCHEMA_VERSION)
+        return cursor.fetchall() == [(SCHEMA_VERSION,)]
+    except mysql.connector.Error:
+        return False
+
+
+def create_schema(cursor):
+    """
+    Erstellt die Testtabelle und die Prozeduren, falls sie noch nicht
+    in der aktuellen Version existieren. Der Cursor muss zu einer
+    Verbindung mit autocommit gehören. Wird auch von conftest.py
+    einmal pro pytest-Lauf aufgerufen.
+    """
+    # Die DDL nur ausführen, wenn das Schema nicht schon von einem früheren Lauf existiert
+    if schema_is_current(cursor):
+        return
+
+    # Alle Anweisungen in einem Paket, der Server trennt sie selbst (auch die Semikolons in BEGIN ... END)
+    run_script(cursor, DDL_SCHEMA, (SCHEMA_VERSION,))
 
 
 class TestMysqlDataManagerLive(unittest.TestCase):
 
+    # SQL der Tests, einmal beim Laden der Klasse erstellt und überall wiederverwendet
+    _SQL_INSERT: ClassVar[str] = f"INSERT INTO {USERS_TABLE} (name, email) VALUES (%s, %s);"
+    _SQL_SELECT_ALL: ClassVar[str] = f"SELECT name, email FROM {USERS_TABLE};"
+    _SQL_SELECT_BY_NAME: ClassVar[str] = f"SELECT id, name, email FROM {USERS_TABLE} WHERE name = %s;"
+    _SQL_SELECT_EMAIL: ClassVar[str] = f"SELECT email FROM {USERS_TABLE} WHERE name = %s;"
+    _SQL_UPDATE_EMAIL: ClassVar[str] = f"UPDATE {USERS_TABLE} SET email = %s WHERE name = %s;"
+    _SQL_TRUNCATE: ClassVar[str] = f"TRUNCATE TABLE {USERS_TABLE};"
+    _SQL_DELETE_ALL: ClassVar[str] = f"DELETE FROM {USERS_TABLE};"
+    _DDL_DROP: ClassVar[str] = textwrap.dedent(f"""\
+        DROP TABLE IF EXISTS {USERS_TABLE};
+        DROP TABLE IF EXISTS {VERSION_TABLE};
+        DROP PROCEDURE IF EXISTS {PROC_SELECT};
+        DROP PROCEDURE IF EXISTS {PROC_INSERT};""")
+
     @classmethod
     def setUpClass(cls):
         """
-        Wird einmal vor allen Tests ausgeführt. Es wird eine
-        Verbindung zur Datenbank hergestellt und eine Testtabelle
-        sowie eine Prozedur erstellt.
+        Wird einmal vor allen Tests ausgeführt. Es wird ein
+        Verbindungspool zur Datenbank erstellt, den alle Tests teilen,
+        und eine Testtabelle sowie die Prozeduren erstellt, falls sie
+        noch nicht in der aktuellen Version existieren.
         """
+        if os.environ.get("DATALAYER_TEST_LOG") == "1":
+            configure(__name__, "test_mysql_data_manager.log")
+
         cls.db_config = mariadb_config
-        cls.data_manager = MysqlDataManager(cls.db_config)
+        cls.pool = MySQLConnectionPool(pool_name="test", pool_size=5, pool_reset_session=False, **cls.db_config)
+        cls.data_manager = MysqlDataManager(cls.pool)
 
         try:
-            conn = cls.data_manager.init_conn()
-            cursor = conn.cursor()
-
-            # Testtabelle
-            cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS users (
-                            id INT AUTO_INCREMENT PRIMARY KEY,
-                            name VARCHAR(255),
-                            email VARCHAR(255)
-                        );
-                    """)
-
-            # Prozedur 1: SELECT (bereits vorhanden)
-            cursor.execute("""
-                        CREATE OR REPLACE PROCEDURE get_user_by_name(IN uname VARCHAR(255))
-                        BEGIN
-                            SELECT id, name, email FROM users WHERE name = uname;
-                        END;
-                    """)
-
-            # NEU: Prozedur 2: INSERT für den rowcount-Test
-            cursor.execute("""
-                        CREATE OR REPLACE PROCEDURE add_user_proc(IN uname VARCHAR(255), IN uemail VARCHAR(255))
-                        BEGIN
-                            INSERT INTO users (name, email) VALUES (uname, uemail);
-                        END;
-                    """)
-
-            conn.commit()
-            cursor.close()
-            conn.close()
+            # Verbindung und Cursor für DDL und das Leeren der Tabelle vor jedem Test.
+            # Mit autocommit braucht jede Anweisung nur einen Roundtrip ohne extra commit.
+            cls._conn = cls.pool.get_connection()
+            cls._conn.autocommit = True
+            cls._cursor = cls._conn.cursor()
+
+            create_schema(cls._cursor)
         except mysql.connector.Error as err:
             raise err
 
     @classmethod
     def tearDownClass(cls):
         """
-        Wird einmal nach allen Tests ausgeführt, um die erstellten
-        Tabellen und Prozeduren zu löschen.
+        Wird einmal nach allen Tests ausgeführt. Die erstellten Tabellen
+        und Prozeduren werden nur mit DATALAYER_TEST_CLEAN=1 gelöscht,
+        damit lokale Läufe die DDL nicht jedes Mal wiederholen.
         """
         try:
-            conn = cls.data_manager.init_conn()
-            cursor = conn.cursor()
+            if os.environ.get("DATALAYER_TEST_CLEAN") != "1":
+                return
 
-            # Testtabelle löschen
-            cursor.execute("DROP TABLE IF EXISTS users;")
+            # Vorbereitete Anweisungen auf die gelöschten Tabellen werden ungültig
+            cls.data_manager.clear_statement_cache()
 
-            # Prozeduren löschen
-            cursor.execute("DROP PROCEDURE IF EXISTS get_user_by_name;")
-            cursor.execute("DROP PROCEDURE IF EXISTS add_user_proc;")
+            # Testtabellen und Prozeduren mit einem Roundtrip löschen
+            run_script(cls._cursor, cls._DDL_DROP)
 
-            conn.commit()
-            cursor.close()
-            conn.close()
-
-            print("Testtabelle und Prozedur erfolgreich gelöscht.")
+            logger.info("Testtabelle und Prozeduren erfolgreich gelöscht.")
 
         except mysql.connector.Error as err:
-            message = "Fehler beim Bereinigen der Testumgebung: %s"
-            logger.error(message, err)
-            print(message, err)
+            logger.error("Fehler beim Bereinigen der Testumgebung: %s", err)
             raise err
 
+        finally:
+            cls._cursor.close()
+            cls._conn.close()
+
     def setUp(self):
         """
-        Wird vor jedem Test ausgeführt, um die Tabelle zu leeren.
+        Wird vor jedem Test ausgeführt, um die Tabelle und den
+        Ergebnis-Cache des Data Managers zu leeren.
+        """
+        self.data_manager.invalidate_cache()
+        try:
+            # TRUNCATE schreibt kein Log pro Zeile und committet selbst
+            self._cursor.execute(self._SQL_TRUNCATE)
+        except mysql.connector.Error:
+            # TRUNCATE braucht das DROP-Recht, ohne dieses wird mit DELETE geleert (autocommit)
+            self._cursor.execute(self._SQL_DELETE_ALL)
+
+    def _seed(self, rows):
+        """
+        Fügt die Testdaten mit einem einzigen mehrzeiligen INSERT ein.
         """
-        conn = self.data_manager.init_conn()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users;")
-        conn.commit()
-        cursor.close()
-        conn.close()
+        return self.data_manager.query(self._SQL_INSERT, rows)
 
     def test_select(self):
         """Testet die select-Methode."""
         # Daten einfügen, um sie später zu selektieren
-        sql_insert = "INSERT INTO users (name, email) VALUES (%s, %s);"
-        values = [('Alice', 'alice@test.com'), ('Bob', 'bob@test.com')]
-        self.data_manager.query(sql_insert, values)
+        self._seed([('Alice', 'alice@test.com'), ('Bob', 'bob@test.com')])
 
         # Daten selektieren und Ergebnis überprüfen
-        sql_select = "SELECT name, email FROM users ORDER BY name;"
-        result = self.data_manager.select(sql_select)
+        # Ohne ORDER BY, die Reihenfolge spielt für den Vergleich keine Rolle
+        result = self.data_manager.select(self._SQL_SELECT_ALL)
 
         expected_result = [('Alice', 'alice@test.com'), ('Bob', 'bob@test.com')]
-        self.assertEqual(result, expected_result)
+        self.assertCountEqual(result, expected_result)
         self.assertIsInstance(result, list)
         if result:
             self.assertIsInstance(result[0], tuple)
 
     def test_query_insert_single(self):
         """Testet die query-Methode für einen einzelnen Insert."""
-        sql_query = "INSERT INTO users (name, email) VALUES (%s, %s);"
         val = ('Charlie', 'charlie@test.com')
-        rows_affected = self.data_manager.query(sql_query, val)
+        rows_affected = self.data_manager.query(self._SQL_INSERT, val)
 
         self.assertEqual(rows_affected, 1)
 
-        # Überprüfen, ob der Datensatz wirklich eingefügt wurde
-        sql_select = "SELECT COUNT(*) FROM users WHERE name = 'Charlie';"
-        result = self.data_manager.select(sql_select)
-        self.assertEqual(result[0][0], 1)
-
     def test_query_insert_multiple(self):
         """Testet die query-Methode für multiple Inserts."""
-        sql_query = "INSERT INTO users (name, email) VALUES (%s, %s);"
         val = [('David', 'david@test.com'), ('Eva', 'eva@test.com')]
-        rows_affected = self.data_manager.query(sql_query, val)
+        rows_affected = self.data_manager.query(self._SQL_INSERT, val)
 
         self.assertEqual(rows_affected, 2)
 
-        # Überprüfen, ob die Datensätze wirklich eingefügt wurden
-        sql_select = "SELECT COUNT(*) FROM users;"
-        result = self.data_manager.select(sql_select)
-        self.assertEqual(result[0][0], 2)
-
     def test_query_update(self):
         """Testet die query-Methode für ein Update."""
         # Daten einfügen, die dann aktualisiert werden
-        affected_rows = self.data_manager.query("INSERT INTO users (name, email) VALUES ('Frank', 'frank@test.com');")
+        self._seed([('Frank', 'frank@test.com')])
 
-        sql_query = "UPDATE users SET email = %s WHERE name = %s;"
         val = ('frank_new@test.com', 'Frank')
-        rows_affected = self.data_manager.query(sql_query, val)
+        rows_affected = self.data_manager.query(self._SQL_UPDATE_EMAIL, val)
 
         self.assertEqual(rows_affected, 1)
 
         # Überprüfen, ob das Update erfolgreich war
-        sql_select = "SELECT email FROM users WHERE name = 'Frank';"
-        result = self.data_manager.select(sql_select)
+        result = self.data_manager.select(self._SQL_SELECT_EMAIL, ('Frank',))
         self.assertEqual(result[0][0], 'frank_new@test.com')
 
     def test_call_proc(self):
         """Testet die call_proc-Methode."""
         # Testdaten einfügen
-        affected_rows = self.data_manager.query("INSERT INTO users (name, email) VALUES ('Grace', 'grace@test.com');")
+        self._seed([('Grace', 'grace@test.com')])
 
         # Prozedur aufrufen
-        result = self.data_manager.call_proc("get_user_by_name", args=('Grace',))
+        result = self.data_manager.call_proc(PROC_SELECT, args=('Grace',))
+
+        self.assertEqual(len(result[0]), 3)
+        self.assertEqual(result[0][1], 'Grace')
+        self.assertEqual(result[0][2], 'grace@test.com')
+
+    def test_select_params(self):
+        """
+        Testet die select-Methode mit Parametern. Die Abfrage von
+        get_user_by_name wird als vorbereitetes SELECT ohne den
+        Umweg über die Prozedur ausgeführt.
+        """
+        self._seed([('Grace', 'grace@test.com')])
+
+        result = self.data_manager.select(self._SQL_SELECT_BY_NAME, ('Grace',))
 
         self.assertEqual(len(result[0]), 3)
         self.assertEqual(result[0][1], 'Grace')
         self.assertEqual(result[0][2], 'grace@test.com')
 
+        # Andere Parameter dürfen nicht das zwischengespeicherte Ergebnis liefern
+        self.assertEqual(self.data_manager.select(self._SQL_SELECT_BY_NAME, ('Nobody',)), [])
+
     def test_call_proc_insert(self):
         """Überprüft call_proc bei einer INSERT-Prozedur."""
         # Aufruf der neuen Insert-Prozedur
-        res = self.data_manager.call_proc("add_user_proc", args=('Heinz', 'heinz@test.com'))
-        print(res)
+        res = self.data_manager.call_proc(PROC_INSERT, args=('Heinz', 'heinz@test.com'))
 
         # Validierung: rowcount muss > 0 sein
         self.assertIsInstance(res, int)
@@ -180,16 +268,69 @@ class TestMysqlDataManagerLive(unittest.TestCase):
 
     def test_init_conn_retry(self):
         """
-        Testet die Wiederverbindung, indem eine falsche Konfiguration
-        erzwungen wird.
+        Testet die Wiederverbindung, indem ein abgelehnter
+        Verbindungsaufbau simuliert wird. Ohne echten Socket gibt es
+        keinen Timeout des Netzwerks.
         """
         wrong_config = self.db_config.copy()
-        wrong_config['port'] = 9999  # Ein falscher Port, um den Fehler zu erzwingen
+        wrong_config['pool_size'] = 0  # Ohne Pool, damit mysql.connector.connect direkt aufgerufen wird
 
         data_manager_wrong_conn = MysqlDataManager(wrong_config)
-        with self.assertRaises(mysql.connector.Error):
+        refused = mysql.connector.InterfaceError("refused")
+        with mock.patch.object(mysql.connector, 'connect', side_effect=refused) as connect:
+            with self.assertRaises(mysql.connector.Error):
+                data_manager_wrong_conn.init_conn(attempts=2, base_delay=0)
+
+        self.assertEqual(connect.call_count, 2)
+
+    def test_init_conn_circuit_breaker(self):
+        """
+        Testet, dass init_conn nach zu vielen Fehlversuchen sofort
+        abbricht, ohne sich erneut zu verbinden.
+        """
+        wrong_config = self.db_config.copy()
+        wrong_config['pool_size'] = 0
+
+        data_manager_wrong_conn = MysqlDataManager(wrong_config, breaker_threshold=2)
+        refused = mysql.connector.InterfaceError("refused")
+        with mock.patch.object(mysql.connector, 'connect', side_effect=refused) as connect:
+            with self.assertRaises(mysql.connector.Error):
+                data_manager_wrong_conn.init_conn(attempts=1)
+            with self.assertRaises(mysql.connector.Error):
+                data_manager_wrong_conn.init_conn(attempts=1)
+
+            with self.assertRaisesRegex(mysql.connector.Error, "Circuit open"):
+                data_manager_wrong_conn.init_conn(attempts=1)
+
+        self.assertEqual(connect.call_count, 2)
+
+    def test_init_conn_circuit_half_open(self):
+        """
+        Testet, dass nach Ablauf von breaker_reset nur ein Aufruf die
+        Datenbank erneut versucht und alle anderen bis zu dessen Ergebnis
+        sofort abbrechen.
+        """
+        wrong_config = self.db_config.copy()
+        wrong_config['pool_size'] = 0
+
+        data_manager_wrong_conn = MysqlDataManager(wrong_config, breaker_threshold=1, breaker_reset=0.1)
+        with mock.patch.object(mysql.connector, 'connect', side_effect=mysql.connector.InterfaceError("refused")):
+            with self.assertRaises(mysql.connector.Error):
+                data_manager_wrong_conn.init_conn(attempts=1)
+        time.sleep(0.2)
+
+        def probe(**kwargs):
+            # Während der Probeverbindung bleibt der Schalter für alle anderen offen
+            with self.assertRaisesRegex(mysql.connector.Error, "Circuit open"):
+                data_manager_wrong_conn.init_conn(attempts=1)
+            return mock.Mock()
+
+        with mock.patch.object(mysql.connector, 'connect', side_effect=probe) as connect:
             data_manager_wrong_conn.init_conn(attempts=1)
 
+        self.assertEqual(connect.call_count, 1)
+        self.assertIsNone(data_manager_wrong_conn._breaker["opened_at"])
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()